@@ -1,7 +1,17 @@
+import hashlib
+import os
+import random
+import tempfile
+import time
+
 import streamlit as st
 from streamlit_autorefresh import st_autorefresh
 import yfinance as yf
 import pandas as pd
+import numpy as np
+import altair as alt
+
+from signals import signal_word
 
 # Auto-refresh every 60 seconds (60000 milliseconds)
 st_autorefresh(interval=60000, limit=None, key="futures_autorefresh")
@@ -31,19 +41,78 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Cache data for 60 seconds to reduce API calls.
-@st.cache_data(ttl=60)
-def get_data(ticker: str) -> pd.DataFrame:
+# The latest batched download is also saved here so a restarted server can reuse it instead of refetching.
+LATEST_DOWNLOAD_FILE = os.path.join(".streamlit", "cache", "futures_latest.pkl")
+
+def load_latest_download(tickers_tuple: tuple, max_age: float = 60):
+    """
+    Returns the download saved by save_latest_download if it is for the same tickers and under max_age
+    seconds old, otherwise None.
+    """
+    try:
+        fetched_at, saved_tickers, df = pd.read_pickle(LATEST_DOWNLOAD_FILE)
+    except Exception:
+        return None
+    if saved_tickers != tickers_tuple or time.time() - fetched_at >= max_age:
+        return None
+    return df
+
+def save_latest_download(tickers_tuple: tuple, df: pd.DataFrame):
     """
-    Fetch historical data for the given ticker.
-    Using period="2d" and interval="1m" allows us to compare the previous day’s close with today’s latest price.
+    Overwrites the single saved download; written to a temp file first so readers never see a partial pickle.
     """
     try:
-        df = yf.Ticker(ticker).history(period="2d", interval="1m")
-        return df
+        os.makedirs(os.path.dirname(LATEST_DOWNLOAD_FILE), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(LATEST_DOWNLOAD_FILE), delete=False) as tmp:
+            pd.to_pickle((time.time(), tickers_tuple, df), tmp)
+        os.replace(tmp.name, LATEST_DOWNLOAD_FILE)
+    except OSError:
+        pass
+
+@st.cache_resource
+def download_restore_state() -> dict:
+    """
+    Tracks whether this server process has already tried the saved download. Only the first fill after a
+    start reads it; later minutes always refetch, otherwise a file under a minute old would be served for
+    the whole of the next minute too.
+    """
+    return {"tried": False}
+
+# Cache data per minute bucket to reduce API calls; a new minute is a new entry, so max_entries bounds memory.
+@st.cache_data(max_entries=2, show_spinner=False)
+def get_all_data(minute_bucket: int, tickers_tuple: tuple) -> pd.DataFrame:
+    """
+    Fetch historical data for all tickers in a single batched request for the given minute.
+    Using period="2d" allows us to compare the previous day’s close with today’s latest price; 5-minute bars are
+    plenty for that and for the charts, at a fifth of the rows of 1-minute bars.
+    Only the 'Close' column is read downstream, so the rest are dropped and prices downcast to float32
+    before caching. Returns a DataFrame with (ticker, 'Close') MultiIndex columns.
+    """
+    restore_state = download_restore_state()
+    if not restore_state["tried"]:
+        restore_state["tried"] = True
+        df = load_latest_download(tickers_tuple)
+        if df is not None:
+            return df
+
+    try:
+        df = yf.download(list(tickers_tuple), period="2d", interval="5m",
+                         group_by="ticker", threads=True, progress=False)
+        df = df.loc[:, (slice(None), "Close")].astype("float32")
     except Exception as e:
-        st.error(f"Error fetching data for {ticker}: {e}")
+        st.error(f"Error fetching futures data: {e}")
         return pd.DataFrame()
+    save_latest_download(tickers_tuple, df)
+    return df
+
+def get_data(df_all: pd.DataFrame, ticker: str) -> pd.DataFrame:
+    """
+    Slices a single ticker's data out of the batched download.
+    Rows are aligned across all tickers, so drop the ones where this ticker has no bars.
+    """
+    if ticker not in df_all.columns.get_level_values(0):
+        return pd.DataFrame()
+    return df_all[ticker].dropna(how="all")
 
 def compute_change(df: pd.DataFrame):
     """
@@ -54,31 +123,77 @@ def compute_change(df: pd.DataFrame):
     if df.empty:
         return None, None, None
 
-    days = sorted(set(df.index.date))
-    if len(days) >= 2:
-        prev_day = days[-2]
-        current_day = days[-1]
-        try:
-            prev_close = df[df.index.date == prev_day]['Close'].iloc[-1]
-            current_latest = df[df.index.date == current_day]['Close'].iloc[-1]
-            change = (current_latest - prev_close) / prev_close * 100
-            return change, prev_close, current_latest
-        except IndexError:
-            return None, None, None
+    closes = df['Close']
+    last_per_day = closes.groupby(closes.index.normalize()).last()
+    if len(last_per_day) >= 2:
+        prev_close, current_latest = last_per_day.iloc[-2], last_per_day.iloc[-1]
+        change = (current_latest - prev_close) / prev_close * 100
+        return change, prev_close, current_latest
     else:
-        open_price = df['Close'].iloc[0]
-        latest_price = df['Close'].iloc[-1]
+        open_price = closes.iat[0]
+        latest_price = closes.iat[-1]
         change = (latest_price - open_price) / open_price * 100
         return change, open_price, latest_price
 
-def generate_chart(df: pd.DataFrame):
+# Charts are drawn at roughly this many points, which is about the pixel density of a dashboard column.
+CHART_POINTS = 100
+
+@st.cache_data(ttl=600, show_spinner=False)
+def chart_spec(ticker: str, close_hash: str, _closes: np.ndarray) -> dict:
+    """
+    Builds the line chart spec for a ticker's 'Close' prices.
+    Keyed on a hash of the prices (the underscore keeps Streamlit from hashing the array itself), so an
+    unchanged series reuses the same spec across reruns and minutes, e.g. for illiquid contracts off-hours.
+    """
+    # Round-trip through the shortest float32 repr so the JSON spec doesn't carry float64 widening noise
+    chart_df = pd.DataFrame({'t': range(len(_closes)), 'c': _closes.astype(str).astype(np.float64)})
+    return alt.Chart(chart_df).mark_line().encode(
+        x=alt.X('t', axis=None),
+        y=alt.Y('c', title=None, scale=alt.Scale(zero=False))
+    ).to_dict()
+
+def generate_chart(ticker: str, df: pd.DataFrame):
     """
     Displays a line chart of the 'Close' prices from the provided DataFrame.
     """
     if df.empty:
         st.write("Data not available.")
     else:
-        st.line_chart(df['Close'])
+        # Plot a fixed-stride sample of about CHART_POINTS float32 prices, ending on the latest one
+        closes = df['Close'].to_numpy()
+        step = max(1, len(closes) // CHART_POINTS)
+        closes = closes[::-1][::step][::-1]
+        close_hash = hashlib.blake2b(closes.tobytes(), digest_size=8).hexdigest()
+        spec = chart_spec(ticker, close_hash, closes)
+        # Pass the cached dict straight through; rebuilding an alt.Chart would re-validate it against the schema
+        st.vega_lite_chart(spec=spec)
+
+# Tickers used by analyze_market, packed into an array in this order and read by the index constants below.
+ORDER = ("ES=F", "NQ=F", "YM=F", "RTY=F", "ZN=F", "VX=F", "CL=F", "GC=F", "DX-Y.NYB")
+ES, NQ, YM, RTY, ZN, VX, CL, GC, DXY = range(9)
+
+# Bit planes of the signal word built by signals.signal_word: each holds one bit per ORDER ticker.
+POS, NEG, FIN, FLAT = range(4)  # > 0, < 0, finite, |change| < 0.5
+
+def _bits(plane: int, *indices: int) -> int:
+    """Returns the mask of the given tickers' bits in one plane of the signal word."""
+    return sum(1 << (plane * len(ORDER) + i) for i in indices)
+
+# (bits that must all be set, bits of which at least one must be set or 0, message) per heuristic.
+SIGNAL_RULES = (
+    # Bullish scenario: ES and NQ up with falling 10-Year yields
+    (_bits(POS, ES, NQ) | _bits(NEG, ZN), 0,
+     "Bullish: S&P 500 and Nasdaq rising with falling 10-Year Treasury yields indicate strong market sentiment."),
+    # Bearish scenario: Broad declines in equities with rising volatility/safe-havens
+    (_bits(NEG, ES, NQ, RTY) | _bits(FIN, VX, GC, ZN), _bits(POS, VX, GC, ZN),
+     "Bearish: Declines across equity futures combined with rising volatility or safe-haven assets suggest a risk-off environment."),
+    # Defensive rotation scenario
+    (_bits(FLAT, ES) | _bits(NEG, NQ, RTY), 0,
+     "Defensive Rotation: Stable S&P 500 but weakness in Nasdaq and Russell 2000 implies investors may be shifting toward blue-chip stocks."),
+    # Inflation concerns scenario
+    (_bits(NEG, ES) | _bits(POS, CL, DXY), 0,
+     "Inflation Concerns: A falling S&P 500 alongside rising crude oil and a stronger dollar may point to inflationary pressures."),
+)
 
 def analyze_market(changes: dict):
     """
@@ -89,41 +204,61 @@ def analyze_market(changes: dict):
       - Defensive rotation: Stable S&P 500 but weakness in tech and small-cap futures.
       - Inflation concerns: Falling S&P 500 with rising crude oil prices and a stronger dollar.
     """
-    signals = []
-    es = changes.get("ES=F")
-    nq = changes.get("NQ=F")
-    ym = changes.get("YM=F")
-    rty = changes.get("RTY=F")
-    zn = changes.get("ZN=F")
-    vx = changes.get("VX=F")
-    cl = changes.get("CL=F")
-    gc = changes.get("GC=F")
-    dxy = changes.get("DX-Y.NYB")
+    arr = np.array([changes.get(k, np.nan) for k in ORDER], dtype=np.float32)  # None -> NaN
+    word = int(signal_word(arr))
+    signals = [message for required, any_of, message in SIGNAL_RULES
+               if (word & required) == required and ((word & any_of) != 0 or any_of == 0)]
 
-    # Bullish scenario: ES and NQ up with falling 10-Year yields
-    if es is not None and nq is not None and zn is not None:
-        if es > 0 and nq > 0 and zn < 0:
-            signals.append("Bullish: S&P 500 and Nasdaq rising with falling 10-Year Treasury yields indicate strong market sentiment.")
+    if not signals:
+        signals.append("No dominant signal detected; the market could trade sideways or await further catalysts.")
 
-    # Bearish scenario: Broad declines in equities with rising volatility/safe-havens
-    if es is not None and nq is not None and rty is not None and vx is not None and gc is not None and zn is not None:
-        if es < 0 and nq < 0 and rty < 0 and (vx > 0 or gc > 0 or zn > 0):
-            signals.append("Bearish: Declines across equity futures combined with rising volatility or safe-haven assets suggest a risk-off environment.")
+    return signals
 
-    # Defensive rotation scenario
-    if es is not None and nq is not None and rty is not None:
-        if abs(es) < 0.5 and nq < 0 and rty < 0:
-            signals.append("Defensive Rotation: Stable S&P 500 but weakness in Nasdaq and Russell 2000 implies investors may be shifting toward blue-chip stocks.")
+@st.cache_resource(ttl=60, max_entries=2)
+def get_frames(minute_bucket: int, tickers_tuple: tuple) -> dict:
+    """
+    Returns each ticker's DataFrame for the given minute, keyed by ticker.
+    Kept as a shared resource rather than cached data so the frames aren't pickled per call.
+    """
+    df_all = get_all_data(minute_bucket, tuple(ticker for ticker, _ in tickers_tuple))
+    return {ticker: get_data(df_all, ticker) for ticker, _ in tickers_tuple}
 
-    # Inflation concerns scenario
-    if es is not None and cl is not None and dxy is not None:
-        if es < 0 and cl > 0 and dxy > 0:
-            signals.append("Inflation Concerns: A falling S&P 500 alongside rising crude oil and a stronger dollar may point to inflationary pressures.")
+@st.cache_data(ttl=60, max_entries=2)
+def build_dashboard_state(minute_bucket: int, tickers_tuple: tuple):
+    """
+    Computes each ticker's change and the market signals once per minute for all sessions.
+    Returns (changes, refs, lasts, signals); the DataFrames themselves come from get_frames().
+    """
+    frames = get_frames(minute_bucket, tickers_tuple)
 
-    if not signals:
-        signals.append("No dominant signal detected; the market could trade sideways or await further catalysts.")
+    # Parallel lists of each ticker's change and prices, in tickers_tuple order.
+    changes, refs, lasts = [], [], []
+    for ticker, _ in tickers_tuple:
+        change, ref, latest = compute_change(frames[ticker])
+        changes.append(change)
+        refs.append(ref)
+        lasts.append(latest)
 
-    return signals
+    # Market analysis based on computed changes
+    signals = analyze_market({ticker: change for (ticker, _), change in zip(tickers_tuple, changes)})
+    return changes, refs, lasts, signals
+
+# Each panel's header text is rendered as a single markdown element rather than one per line.
+PANEL_TEMPLATE = "**{name}**\n\nChange: {change:+.2f}%\n\nFrom: {ref:.2f}  →  To: {latest:.2f}"
+PANEL_UNAVAILABLE_TEMPLATE = "**{name}**\n\nData unavailable"
+
+def refresh_bucket(ttl: int = 60, early: float = 0.2) -> int:
+    """
+    Returns the cache bucket for the current time, refreshing probabilistically early to avoid a stampede.
+    In the last `early` fraction of each window, callers move on to the next bucket with a probability that
+    ramps from 0 to 1, so one session usually computes it while the rest keep reading the current bucket.
+    """
+    now = time.time()
+    bucket, age = divmod(now, ttl)
+    threshold = ttl * (1 - early)
+    if age > threshold and random.random() < (age - threshold) / (ttl * early):
+        bucket += 1
+    return int(bucket)
 
 def main():
     st.title("Overnight Futures Analysis Dashboard (Live Data)")
@@ -146,101 +281,45 @@ def main():
         "6J=F": "Japanese Yen Futures (6J)"
     }
 
-    # Dictionary to store each ticker's data, change, and prices.
-    data_dict = {}
-    changes = {}
-
-    # Retrieve data and compute changes for each ticker
-    for ticker, name in tickers.items():
-        df = get_data(ticker)
-        change, ref, latest = compute_change(df)
-        changes[ticker] = change
-        data_dict[ticker] = {
-            "name": name,
-            "data": df,
-            "change": change,
-            "ref": ref,
-            "latest": latest
-        }
+    # Fetch and analysis results are shared by every session within the same minute
+    minute_bucket = refresh_bucket()
+    tickers_tuple = tuple(tickers.items())
+    changes, refs, lasts, signals = build_dashboard_state(minute_bucket, tickers_tuple)
+    frames = get_frames(minute_bucket, tickers_tuple)
+
+    # Render table: parallel lists indexed by each ticker's position in tickers_tuple
+    symbols = [ticker for ticker, _ in tickers_tuple]
+    names = [name for _, name in tickers_tuple]
+    dfs = [frames[ticker] for ticker in symbols]
+    index_of = {ticker: i for i, ticker in enumerate(symbols)}
+
+    def render_panel(i: int):
+        if changes[i] is not None:
+            st.markdown(PANEL_TEMPLATE.format(name=names[i], change=changes[i], ref=refs[i], latest=lasts[i]))
+        else:
+            st.markdown(PANEL_UNAVAILABLE_TEMPLATE.format(name=names[i]))
+        generate_chart(symbols[i], dfs[i])
 
-    # Market analysis based on computed changes
-    signals = analyze_market(changes)
     st.header("Market Analysis")
     for signal in signals:
         st.write(f"- {signal}")
 
     st.header("Overnight Futures Data")
 
-    # --- Index Futures ---
-    st.subheader("Index Futures")
-    index_tickers = ["ES=F", "NQ=F", "YM=F", "RTY=F"]
-    cols = st.columns(2)
-    for i, ticker in enumerate(index_tickers):
-        with cols[i % 2]:
-            info = data_dict[ticker]
-            st.markdown(f"**{info['name']}**")
-            if info['change'] is not None:
-                st.write(f"Change: {info['change']:.2f}%")
-                st.write(f"From: {info['ref']:.2f}  →  To: {info['latest']:.2f}")
-            else:
-                st.write("Data unavailable")
-            generate_chart(info['data'])
-
-    # --- Volatility Futures ---
-    st.subheader("Volatility Futures")
-    info = data_dict["VX=F"]
-    st.markdown(f"**{info['name']}**")
-    if info['change'] is not None:
-        st.write(f"Change: {info['change']:.2f}%")
-        st.write(f"From: {info['ref']:.2f}  →  To: {info['latest']:.2f}")
-    else:
-        st.write("Data unavailable")
-    generate_chart(info['data'])
-
-    # --- Bond Futures ---
-    st.subheader("Bond Futures")
-    bond_tickers = ["ZN=F", "ZB=F"]
-    cols = st.columns(2)
-    for i, ticker in enumerate(bond_tickers):
-        with cols[i]:
-            info = data_dict[ticker]
-            st.markdown(f"**{info['name']}**")
-            if info['change'] is not None:
-                st.write(f"Change: {info['change']:.2f}%")
-                st.write(f"From: {info['ref']:.2f}  →  To: {info['latest']:.2f}")
-            else:
-                st.write("Data unavailable")
-            generate_chart(info['data'])
-
-    # --- Commodity Futures ---
-    st.subheader("Commodity Futures")
-    commodity_tickers = ["CL=F", "GC=F", "HG=F"]
-    cols = st.columns(3)
-    for i, ticker in enumerate(commodity_tickers):
-        with cols[i]:
-            info = data_dict[ticker]
-            st.markdown(f"**{info['name']}**")
-            if info['change'] is not None:
-                st.write(f"Change: {info['change']:.2f}%")
-                st.write(f"From: {info['ref']:.2f}  →  To: {info['latest']:.2f}")
-            else:
-                st.write("Data unavailable")
-            generate_chart(info['data'])
-
-    # --- Currency Futures ---
-    st.subheader("Currency Futures")
-    currency_tickers = ["DX-Y.NYB", "6E=F", "6J=F"]
-    cols = st.columns(3)
-    for i, ticker in enumerate(currency_tickers):
-        with cols[i]:
-            info = data_dict[ticker]
-            st.markdown(f"**{info['name']}**")
-            if info['change'] is not None:
-                st.write(f"Change: {info['change']:.2f}%")
-                st.write(f"From: {info['ref']:.2f}  →  To: {info['latest']:.2f}")
-            else:
-                st.write("Data unavailable")
-            generate_chart(info['data'])
+    # (subheader, tickers, number of columns) for each section
+    sections = [
+        ("Index Futures", ["ES=F", "NQ=F", "YM=F", "RTY=F"], 2),
+        ("Volatility Futures", ["VX=F"], 1),
+        ("Bond Futures", ["ZN=F", "ZB=F"], 2),
+        ("Commodity Futures", ["CL=F", "GC=F", "HG=F"], 3),
+        ("Currency Futures", ["DX-Y.NYB", "6E=F", "6J=F"], 3),
+    ]
+    for title, section_tickers, n_cols in sections:
+        st.subheader(title)
+        cols = st.columns(n_cols)
+        for j, ticker in enumerate(section_tickers):
+            with cols[j % n_cols]:
+                render_panel(index_of[ticker])
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,19 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; without it the kernel runs as plain NumPy.
+    def njit(*args, **kwargs):
+        return lambda fn: fn
+
+# Kept out of FuturesDash.py on purpose: loading a cached kernel makes numba import its defining module,
+# and re-importing the Streamlit script would re-run the whole page inside a cached function.
+
+@njit(cache=True)
+def signal_word(arr):
+    """
+    Packs the POS/NEG/FIN/FLAT comparisons over an ORDER-packed array of changes (NaN when missing)
+    into a single bitmask. NaN compares false everywhere, so a missing change sets no bits.
+    """
+    planes = np.concatenate((arr > 0, arr < 0, np.isfinite(arr), np.abs(arr) < 0.5))
+    return (planes.astype(np.uint64) << np.arange(planes.size, dtype=np.uint64)).sum()